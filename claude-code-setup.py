@@ -6,129 +6,232 @@ Claude Code 一键配置脚本
 Python 3.8+
 """
 
+import functools
 import os
 import sys
 import re
-import json
-import shutil
-import subprocess
 from pathlib import Path
 from typing import Dict, List, Optional
+# json / subprocess 只在少数函数中用到，在使用处按需导入以缩短启动时间
+
+# 运行期间不会变化的平台信息，启动时读取一次
+_IS_WIN = sys.platform == 'win32'
+_HOME = Path.home()
+_SHELL = os.environ.get('SHELL', '')
+# 常用的 home 相对路径也只构造一次
+_CLAUDE_DIR = _HOME / '.claude'
+_BASHRC = _HOME / '.bashrc'
+_BASH_PROFILE = _HOME / '.bash_profile'
+# 单一 rc/profile 文件的运行环境（bash 需要在两个文件中选择，单独处理）
+_SHELL_RC_FILES = {
+    'zsh': _HOME / '.zshrc',
+    'fish': _HOME / '.config' / 'fish' / 'config.fish',
+    'profile': _HOME / '.profile',
+}
 
 # 颜色支持
+@functools.lru_cache(maxsize=1)
+def _enable_win_vt() -> bool:
+    """为 Windows 10+ 控制台开启 ANSI 颜色支持（每个进程只调用一次）"""
+    if not _IS_WIN:
+        return False
+    try:
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        # 获取标准输出句柄
+        handle = kernel32.GetStdHandle(-11)
+        # 获取当前控制台模式
+        mode = ctypes.c_ulong()
+        kernel32.GetConsoleMode(handle, ctypes.byref(mode))
+        # 添加 ENABLE_VIRTUAL_TERMINAL_PROCESSING (0x0004) 标志
+        kernel32.SetConsoleMode(handle, mode.value | 0x0004)
+        return True
+    except Exception:
+        return False
+
+
+def _check_color_support() -> bool:
+    """检查终端是否支持颜色（只在导入时调用一次，结果保存在 _COLOR_ENABLED）"""
+    # 遵循 NO_COLOR 约定，优先于终端探测
+    if os.environ.get('NO_COLOR'):
+        return False
+    # Windows 上即使强制开启颜色，也需要先打开控制台的 ANSI 支持
+    vt_enabled = _enable_win_vt()
+    if os.environ.get('FORCE_COLOR'):
+        return True
+    if _IS_WIN:
+        return vt_enabled or os.environ.get('TERM') is not None
+    return sys.stdout is not None and sys.stdout.isatty()
+
+
+_COLOR_ENABLED = _check_color_support()
+
+
 class Colors:
     """跨平台终端颜色支持"""
 
     def __init__(self):
-        self.enabled = self._check_color_support()
-
-    def _check_color_support(self) -> bool:
-        """检查终端是否支持颜色"""
-        # Windows 10+ 支持 ANSI 颜色
-        if sys.platform == 'win32':
-            try:
-                import ctypes
-                kernel32 = ctypes.windll.kernel32
-                # 获取标准输出句柄
-                handle = kernel32.GetStdHandle(-11)
-                # 获取当前控制台模式
-                mode = ctypes.c_ulong()
-                kernel32.GetConsoleMode(handle, ctypes.byref(mode))
-                # 添加 ENABLE_VIRTUAL_TERMINAL_PROCESSING (0x0004) 标志
-                kernel32.SetConsoleMode(handle, mode.value | 0x0004)
-                return True
-            except Exception:
-                return os.environ.get('TERM') is not None
-        return sys.stdout.isatty()
-
-    @property
-    def RED(self) -> str:
-        return '\033[0;31m' if self.enabled else ''
-
-    @property
-    def GREEN(self) -> str:
-        return '\033[0;32m' if self.enabled else ''
-
-    @property
-    def YELLOW(self) -> str:
-        return '\033[1;33m' if self.enabled else ''
-
-    @property
-    def BLUE(self) -> str:
-        return '\033[0;34m' if self.enabled else ''
-
-    @property
-    def CYAN(self) -> str:
-        return '\033[0;36m' if self.enabled else ''
-
-    @property
-    def NC(self) -> str:
-        return '\033[0m' if self.enabled else ''
+        self.enabled = _COLOR_ENABLED
+        # 预先计算颜色字符串，避免每次访问都执行属性方法
+        self.RED = '\033[0;31m' if self.enabled else ''
+        self.GREEN = '\033[0;32m' if self.enabled else ''
+        self.YELLOW = '\033[1;33m' if self.enabled else ''
+        self.BLUE = '\033[0;34m' if self.enabled else ''
+        self.CYAN = '\033[0;36m' if self.enabled else ''
+        self.NC = '\033[0m' if self.enabled else ''
 
 
 colors = Colors()
 
+
+def cprint(line: str, color: str = '') -> None:
+    """以指定颜色输出一行文本（合并为一次写入）"""
+    if color:
+        print(f"{color}{line}{colors.NC}\n", end='')
+    else:
+        print(f"{line}\n", end='')
+
 MANAGED_ENV_BLOCK_START = "# >>> Claude Code env (managed by claude-code-setup.py) >>>"
 MANAGED_ENV_BLOCK_END = "# <<< Claude Code env <<<"
+# 以字面量开头，re 可以直接做子串搜索定位 block，而不必在每个位置尝试匹配
+_MANAGED_ENV_BLOCK_RE = re.compile(
+    re.escape(MANAGED_ENV_BLOCK_START) + r'.*?' + re.escape(MANAGED_ENV_BLOCK_END),
+    re.DOTALL
+)
+
+
+# ANSI 转义序列需要正则匹配变长的 CSI 序列（ESC [ 或 8 位 CSI）
+_ANSI_RE = re.compile(r'(?:\x1b\[|\x9b)[0-9;]*[a-zA-Z~]')
+# 控制字符直接用 str.translate 删除（C 层单次遍历）
+_DEL_TABLE = dict.fromkeys(list(range(0x20)) + [0x7f], None)
 
 
 def clean_input(text: str) -> str:
     """清理输入中的不可见字符（控制字符、转义序列等）"""
-    # 移除 ANSI 转义序列
-    text = re.sub(r'\x1b\[[0-9;]*[a-zA-Z~]', '', text)
-    # 移除控制字符
-    text = re.sub(r'[\x00-\x1f\x7f]', '', text)
+    # 常见输入既没有转义序列也没有控制字符，先做廉价检查再决定是否处理
+    if '\x1b' in text or '\x9b' in text:
+        # 移除 ANSI 转义序列
+        text = _ANSI_RE.sub('', text)
+    if not text.isprintable():
+        # 移除控制字符
+        text = text.translate(_DEL_TABLE)
     return text.strip()
 
 
-def get_input(prompt: str) -> str:
-    """获取用户输入并清理"""
-    try:
-        if sys.stdin is not None and sys.stdin.isatty():
-            return clean_input(input(prompt))
+def _detect_input_mode() -> str:
+    """启动时确定一次读取用户输入的方式"""
+    if sys.stdin is not None and sys.stdin.isatty():
+        return 'stdin'
+    # stdin 被管道占用（如 curl | python3），改为直接读取终端设备
+    return 'tty_win' if _IS_WIN else 'tty_posix'
+
+
+_INPUT_MODE = _detect_input_mode()
+# 终端设备句柄在首次使用时打开，之后所有提示复用
+_TTY_FILES: Optional[tuple] = None
+
+
+def _open_tty() -> tuple:
+    """打开（或复用）终端设备的读写句柄"""
+    global _TTY_FILES
+    if _TTY_FILES is None:
+        if _INPUT_MODE == 'tty_win':
+            tty_in = 'CONIN$'
+            tty_out = 'CONOUT$'
+        else:
+            tty_in = '/dev/tty'
+            tty_out = '/dev/tty'
 
+        tty_r = open(tty_in, 'r', encoding='utf-8', errors='ignore')
         try:
-            if sys.platform == 'win32':
-                tty_in = 'CONIN$'
-                tty_out = 'CONOUT$'
-            else:
-                tty_in = '/dev/tty'
-                tty_out = '/dev/tty'
+            tty_w = open(tty_out, 'w', encoding='utf-8', errors='ignore')
+        except OSError:
+            tty_r.close()
+            raise
+        _TTY_FILES = (tty_r, tty_w)
+    return _TTY_FILES
 
-            with open(tty_out, 'w', encoding='utf-8', errors='ignore') as tty_w:
-                tty_w.write(prompt)
-                tty_w.flush()
 
-            with open(tty_in, 'r', encoding='utf-8', errors='ignore') as tty_r:
-                return clean_input(tty_r.readline())
+def _read_raw(prompt: str) -> str:
+    """按启动时确定的方式读取一行原始输入"""
+    global _INPUT_MODE
+    if _INPUT_MODE in ('tty_win', 'tty_posix'):
+        try:
+            tty_r, tty_w = _open_tty()
         except OSError:
-            return clean_input(input(prompt))
+            # 无法打开终端设备，后续提示不再重试
+            _INPUT_MODE = 'stdin_fallback'
+        else:
+            tty_w.write(prompt)
+            tty_w.flush()
+            return tty_r.readline()
+    return input(prompt)
+
+
+def get_input(prompt: str) -> str:
+    """获取用户输入并清理"""
+    try:
+        return clean_input(_read_raw(prompt))
     except EOFError:
         return ''
 
 
-def confirm(prompt: str, default: bool = False) -> bool:
-    """确认提示"""
+# 视为"是"的回答（直接查表，无需先 lower()）
+_YES_RESPONSES = frozenset({'y', 'yes', 'Y', 'YES', 'Yes'})
+
+
+def confirm(prompt: str, default: bool = False, color: str = '') -> bool:
+    """确认提示（color 只作用于提示文本，不包括 [y/N] 后缀）"""
     suffix = '[Y/n]' if default else '[y/N]'
-    response = get_input(f"{prompt} {suffix}: ").lower()
-    if not response:
-        return default
-    return response in ('y', 'yes')
+    if color:
+        prompt = f"{color}{prompt}{colors.NC}"
+    response = get_input(f"{prompt} {suffix}: ")
+    return response in _YES_RESPONSES if response else default
+
+
+@functools.lru_cache(maxsize=None)
+def _which(command: str) -> Optional[str]:
+    """shutil.which 的缓存版本，同一命令在整个进程中只查找一次"""
+    import shutil
+    return shutil.which(command)
 
 
 def check_command_exists(command: str) -> bool:
     """检查命令是否存在"""
-    return shutil.which(command) is not None
+    return _which(command) is not None
+
+
+# Windows 上低层 fd 默认是文本模式，会把 \n 转成 \r\n，需要显式指定二进制
+_PRIVATE_OPEN_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0)
+
+
+def write_private_file(path, data: bytes) -> None:
+    """写入仅当前用户可读写（0o600）的文件：一次 open、直接写字节，不经过文本层"""
+    fd = os.open(str(path), _PRIVATE_OPEN_FLAGS, 0o600)
+    try:
+        # O_CREAT 的权限只对新建文件生效，已存在的文件需要单独收紧
+        if hasattr(os, 'fchmod'):
+            os.fchmod(fd, 0o600)
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
 
 
 def run_command(args: list, check: bool = True) -> bool:
     """运行命令"""
+    import subprocess
     try:
+        # 只关心返回码：输出直接丢弃，无需创建管道和解码；
+        # stdin 也不继承，避免子进程等待输入而卡住（curl | python3 时 stdin 是管道）
         result = subprocess.run(
             args,
             check=check,
-            capture_output=True,
-            text=True
+            shell=False,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
         )
         return result.returncode == 0
     except subprocess.CalledProcessError:
@@ -137,48 +240,85 @@ def run_command(args: list, check: bool = True) -> bool:
         return False
 
 
+_BANNER = """\
+╔════════════════════════════════════════════════════════════╗
+║           Claude Code 一键配置脚本                         ║
+║        适用于 Windows / Linux / WSL / macOS                ║
+╚════════════════════════════════════════════════════════════╝
+"""
+
+
+_RULE = '═' * 60
+
+
+def _cyan_header(title: str) -> str:
+    """生成 CYAN 分节标题（上下分隔线，前后各空一行），供一次 print 输出"""
+    return f"\n{colors.CYAN}{_RULE}\n{title}\n{_RULE}{colors.NC}\n"
+
+
 def print_banner():
     """打印横幅"""
-    print(f"{colors.BLUE}")
-    print("╔════════════════════════════════════════════════════════════╗")
-    print("║           Claude Code 一键配置脚本                         ║")
-    print("║        适用于 Windows / Linux / WSL / macOS                ║")
-    print("╚════════════════════════════════════════════════════════════╝")
-    print(f"{colors.NC}")
+    # 整个横幅一次写出
+    print(f"{colors.BLUE}\n{_BANNER}{colors.NC}\n", end='', flush=True)
+
+
+def _npm_global_claude() -> Optional[Path]:
+    """npm 全局安装 @anthropic-ai/claude-code 时 claude 的常见位置"""
+    if _IS_WIN:
+        appdata = os.environ.get('APPDATA')
+        return Path(appdata) / 'npm' / 'claude.cmd' if appdata else None
+    return Path('/usr/local/bin/claude')
+
+
+@functools.lru_cache(maxsize=1)
+def _claude_path() -> Optional[str]:
+    """解析 claude 可执行文件的绝对路径（结果缓存，整个进程只解析一次）"""
+    # 先直接检查 npm 全局安装位置：一次 stat，而不是 PATH × PATHEXT 次
+    candidate = _npm_global_claude()
+    if candidate is not None and candidate.is_file() and os.access(candidate, os.X_OK):
+        return str(candidate)
+    return _which('claude')
 
 
 def check_claude_installed() -> bool:
     """检查 Claude Code 是否已安装"""
-    if not check_command_exists('claude'):
-        print(f"{colors.YELLOW}[提示] 未检测到 Claude Code，请先安装：{colors.NC}")
+    if _claude_path() is None:
+        cprint("[提示] 未检测到 Claude Code，请先安装：", colors.YELLOW)
         print("  npm install -g @anthropic-ai/claude-code")
         print()
         return False
     return True
 
 
+# API 密钥校验的提示文本（只有出错时才会输出）
+_API_KEY_EMPTY_MSG = "[错误] API 密钥不能为空！"
+_API_KEY_FORMAT_MSG = "[警告] API 密钥格式可能不正确，通常以 'sk-' 开头"
+_CANCELLED_MSG = "已取消配置"
+
+
 def get_api_config() -> tuple:
     """获取 API 配置"""
     # Base URL
-    print(f"{colors.GREEN}请输入 API Base URL (直接回车使用默认值 https://api.anthropic.com):{colors.NC}")
+    cprint("请输入 API Base URL (直接回车使用默认值 https://api.anthropic.com):", colors.GREEN)
     base_url = get_input("")
     if not base_url:
         base_url = "https://api.anthropic.com"
-    print(f"{colors.BLUE}使用 Base URL: {base_url}{colors.NC}")
+    cprint(f"使用 Base URL: {base_url}", colors.BLUE)
 
     # API Key
     print()
-    print(f"{colors.GREEN}请输入您的 API 密钥 (sk-xxx):{colors.NC}")
+    cprint("请输入您的 API 密钥 (sk-xxx):", colors.GREEN)
     api_key = get_input("")
 
     if not api_key:
-        print(f"{colors.RED}[错误] API 密钥不能为空！{colors.NC}")
+        cprint(_API_KEY_EMPTY_MSG, colors.RED)
         sys.exit(1)
 
-    if not api_key.startswith('sk-'):
-        print(f"{colors.YELLOW}[警告] API 密钥格式可能不正确，通常以 'sk-' 开头{colors.NC}")
+    # 一次切片比较即可判断前缀，常见的正确输入不会触发任何提示输出
+    if api_key[:3] != 'sk-':
+        cprint(_API_KEY_FORMAT_MSG, colors.YELLOW)
         if not confirm("是否继续？", default=False):
-            print(f"{colors.RED}已取消配置{colors.NC}")
+            cprint(_CANCELLED_MSG, colors.RED)
             sys.exit(1)
 
     return base_url, api_key
@@ -186,155 +326,241 @@ def get_api_config() -> tuple:
 
 def write_config_file(base_url: str, api_key: str) -> Path:
     """写入配置文件"""
-    config_dir = Path.home() / '.claude'
-    config_dir.mkdir(parents=True, exist_ok=True)
+    import json
+    config_dir = _CLAUDE_DIR
+    # 目录通常已存在：一次 stat 即可，无需 mkdir 失败后再确认
+    if not config_dir.is_dir():
+        config_dir.mkdir(parents=True, exist_ok=True)
 
-    # 写入 settings.json
+    # 写入 settings.json：在已有配置上合并，保留用户的其他设置
     config_file = config_dir / 'settings.json'
-    config_content = {
-        "env": {
-            "ANTHROPIC_AUTH_TOKEN": api_key,
-            "ANTHROPIC_BASE_URL": base_url,
-            "API_TIMEOUT_MS": "3000000",
-            "CLAUDE_CODE_DISABLE_NONESSENTIAL_TRAFFIC": "1"
-        },
-        "model": "opus"
+    try:
+        # utf-8-sig 会去掉开头可能存在的 BOM
+        existing = json.loads(config_file.read_bytes().decode('utf-8-sig'))
+    except FileNotFoundError:
+        existing = {}
+    except (OSError, ValueError) as e:
+        # 无法读取或解析时绝不覆盖用户的配置（UnicodeDecodeError / JSONDecodeError 都是 ValueError）
+        existing = e
+    if not isinstance(existing, dict):
+        reason = existing if isinstance(existing, Exception) else "顶层不是 JSON 对象"
+        print()
+        cprint(f"[警告] 无法解析 {config_file}（{reason}），文件保持不变", colors.YELLOW)
+        cprint("✗ API 配置未写入，请修正该文件后重新运行本脚本", colors.RED)
+        return config_dir
+
+    config_content = dict(existing)
+    env = config_content.get("env")
+    config_content["env"] = {
+        **(env if isinstance(env, dict) else {}),
+        "ANTHROPIC_AUTH_TOKEN": api_key,
+        "ANTHROPIC_BASE_URL": base_url,
+        "API_TIMEOUT_MS": "3000000",
+        "CLAUDE_CODE_DISABLE_NONESSENTIAL_TRAFFIC": "1"
     }
-    config_file.write_text(json.dumps(config_content, indent=2), encoding='utf-8')
+    config_content["model"] = "opus"
+
+    # 内容未变化时跳过写入
+    if config_content != existing:
+        # 保留 indent=2 方便手动编辑；文件中包含 API Key，仅允许当前用户读写
+        write_private_file(config_file, json.dumps(config_content, indent=2, ensure_ascii=False).encode('utf-8'))
 
     print()
-    print(f"{colors.GREEN}✓ API 配置完成！{colors.NC}")
+    cprint("✓ API 配置完成！", colors.GREEN)
     print(f"配置文件位置: {colors.BLUE}{config_file}{colors.NC}")
 
     return config_dir
 
 
+def get_claude_global_config_path() -> Path:
+    """返回 Claude Code 保存用户级 MCP 配置的文件（与 claude mcp add -s user 写入的位置一致）"""
+    config_dir = os.environ.get('CLAUDE_CONFIG_DIR')
+    if config_dir:
+        return Path(config_dir).expanduser() / '.claude.json'
+    return _HOME / '.claude.json'
+
+
+def write_claude_mcp_servers(servers: Dict[str, dict]) -> bool:
+    """把 MCP 服务器一次性合并写入 Claude Code 全局配置的 mcpServers（claude CLI 添加失败时的后备方案）"""
+    import json
+    # ~/.claude.json 可能是指向 dotfiles 仓库的符号链接：写入链接目标，而不是把链接替换成普通文件
+    config_file = Path(os.path.realpath(get_claude_global_config_path()))
+    try:
+        data = json.loads(config_file.read_text(encoding='utf-8'))
+    except FileNotFoundError:
+        data = {}
+    except Exception:
+        # 无法解析时绝不覆盖用户的配置，交给 claude CLI 处理
+        return False
+    if not isinstance(data, dict) or not isinstance(data.get('mcpServers', {}), dict):
+        return False
+
+    data.setdefault('mcpServers', {}).update(servers)
+
+    # 先写临时文件再替换，保证文件不会只写了一半。这里绕过了 claude 自身带锁的写入流程：
+    # 正在运行的 claude 保存其内存中的全局配置时仍可能覆盖这次写入的 mcpServers
+    tmp_file = config_file.with_name(config_file.name + '.tmp')
+    try:
+        config_file.parent.mkdir(parents=True, exist_ok=True)
+        # 配置中包含 API Key，仅允许当前用户读写
+        write_private_file(tmp_file, json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8'))
+        os.replace(tmp_file, config_file)
+        return True
+    except Exception:
+        try:
+            tmp_file.unlink()
+        except OSError:
+            pass
+        return False
+
+
+def add_mcp_servers_via_cli(servers: Dict[str, dict]) -> List[str]:
+    """逐个调用 claude mcp add-json 添加 MCP 服务器，返回失败的服务器名"""
+    import json
+    # 直接使用解析好的绝对路径，子进程无需再次搜索 PATH
+    claude = _claude_path() or 'claude'
+    return [
+        name for name, server in servers.items()
+        if not run_command([claude, 'mcp', 'add-json', name, json.dumps(server), '-s', 'user'], check=False)
+    ]
+
+
+# MCP 服务器名 -> 显示名称
+_MCP_LABELS = {'context7': 'Context7', 'cunzhi': 'Cunzhi', 'github': 'GitHub'}
+
+
 def install_mcp_servers(claude_available: bool):
     """安装 MCP 服务器"""
-    print()
-    print(f"{colors.CYAN}════════════════════════════════════════════════════════════{colors.NC}")
-    print(f"{colors.CYAN}                    MCP 服务器安装                          {colors.NC}")
-    print(f"{colors.CYAN}════════════════════════════════════════════════════════════{colors.NC}")
-    print()
+    print(_cyan_header("                    MCP 服务器安装                          "))
 
     if not claude_available:
-        print(f"{colors.YELLOW}[跳过] Claude Code 未安装，无法配置 MCP 服务器{colors.NC}")
+        cprint("[跳过] Claude Code 未安装，无法配置 MCP 服务器", colors.YELLOW)
         return
 
+    # 先收集全部选择，最后统一安装
+    servers: Dict[str, dict] = {}
+
     # Context7 MCP
-    if confirm(f"{colors.GREEN}是否安装 Context7 MCP？(用于获取最新库文档){colors.NC}", default=False):
-        print(f"{colors.GREEN}请输入 Context7 API Key:{colors.NC}")
+    if confirm("是否安装 Context7 MCP？(用于获取最新库文档)", default=False, color=colors.GREEN):
+        cprint("请输入 Context7 API Key:", colors.GREEN)
         context7_key = get_input("")
         if context7_key:
-            print(f"{colors.BLUE}正在安装 Context7 MCP...{colors.NC}")
-            if run_command(['claude', 'mcp', 'add', 'context7', '-s', 'user', '--',
-                           'npx', '-y', '@upstash/context7-mcp', '--api-key', context7_key], check=False):
-                print(f"{colors.GREEN}✓ Context7 MCP 安装成功{colors.NC}")
-            else:
-                print(f"{colors.RED}✗ Context7 MCP 安装失败{colors.NC}")
+            servers['context7'] = {
+                "type": "stdio",
+                "command": "npx",
+                "args": ["-y", "@upstash/context7-mcp", "--api-key", context7_key],
+                "env": {}
+            }
         else:
-            print(f"{colors.YELLOW}[跳过] 未输入 API Key，跳过 Context7 安装{colors.NC}")
+            cprint("[跳过] 未输入 API Key，跳过 Context7 安装", colors.YELLOW)
 
     # Cunzhi MCP
     print()
-    if confirm(f"{colors.GREEN}是否安装 Cunzhi MCP？(智能代码审查工具){colors.NC}", default=False):
-        print(f"{colors.GREEN}请输入 Cunzhi 可执行文件的完整路径 (如 /path/to/cz 或 C:\\path\\to\\cz.exe):{colors.NC}")
+    if confirm("是否安装 Cunzhi MCP？(智能代码审查工具)", default=False, color=colors.GREEN):
+        cprint("请输入 Cunzhi 可执行文件的完整路径 (如 /path/to/cz 或 C:\\path\\to\\cz.exe):", colors.GREEN)
         cunzhi_path = get_input("")
         if cunzhi_path:
             cunzhi_path_obj = Path(cunzhi_path)
             if cunzhi_path_obj.exists():
-                print(f"{colors.BLUE}正在安装 Cunzhi MCP...{colors.NC}")
-                if run_command(['claude', 'mcp', 'add', 'cunzhi', '-s', 'user', '--', str(cunzhi_path_obj)], check=False):
-                    print(f"{colors.GREEN}✓ Cunzhi MCP 安装成功{colors.NC}")
-                else:
-                    print(f"{colors.RED}✗ Cunzhi MCP 安装失败{colors.NC}")
+                servers['cunzhi'] = {
+                    "type": "stdio",
+                    "command": str(cunzhi_path_obj),
+                    "args": [],
+                    "env": {}
+                }
             else:
-                print(f"{colors.YELLOW}[跳过] 文件不存在: {cunzhi_path}{colors.NC}")
+                cprint(f"[跳过] 文件不存在: {cunzhi_path}", colors.YELLOW)
         else:
-            print(f"{colors.YELLOW}[跳过] 未输入路径，跳过 Cunzhi 安装{colors.NC}")
+            cprint("[跳过] 未输入路径，跳过 Cunzhi 安装", colors.YELLOW)
 
     # GitHub MCP
     print()
-    if confirm(f"{colors.GREEN}是否安装 GitHub MCP？(GitHub 文档查询){colors.NC}", default=True):
-        print(f"{colors.BLUE}正在安装 GitHub MCP...{colors.NC}")
-        if run_command(['claude', 'mcp', 'add', 'github', '-s', 'user', '--transport', 'http', 'https://gitmcp.io/docs'], check=False):
-            print(f"{colors.GREEN}✓ GitHub MCP 安装成功{colors.NC}")
+    if confirm("是否安装 GitHub MCP？(GitHub 文档查询)", default=True, color=colors.GREEN):
+        servers['github'] = {
+            "type": "http",
+            "url": "https://gitmcp.io/docs"
+        }
+
+    if not servers:
+        return
+
+    cprint("正在安装 MCP 服务器...", colors.BLUE)
+    # 优先交给 claude CLI（走它自己的加锁写入流程）；CLI 失败的（如同名服务器已存在）再直接合并写入配置文件
+    failures = add_mcp_servers_via_cli(servers)
+    if failures and write_claude_mcp_servers({name: servers[name] for name in failures}):
+        failures = []
+    for name in servers:
+        if name in failures:
+            cprint(f"✗ {_MCP_LABELS[name]} MCP 安装失败", colors.RED)
         else:
-            print(f"{colors.RED}✗ GitHub MCP 安装失败{colors.NC}")
+            cprint(f"✓ {_MCP_LABELS[name]} MCP 安装成功", colors.GREEN)
+
+
+# SHELL 关键字到运行环境的映射（按优先级排列）
+_SHELL_ENVS = {'zsh': 'zsh', 'fish': 'fish', 'bash': 'bash'}
 
 
 def detect_default_environment() -> str:
     """推断默认运行环境类型（用于预填选择项）"""
-    if sys.platform == 'win32':
+    if _IS_WIN:
         return 'powershell'
-    shell = os.environ.get('SHELL', '')
-    if 'zsh' in shell:
-        return 'zsh'
-    if 'fish' in shell:
-        return 'fish'
-    if 'bash' in shell:
-        return 'bash'
+    for name, env in _SHELL_ENVS.items():
+        if name in _SHELL:
+            return env
     return 'profile'
 
 
+# 环境选择菜单（每个菜单一次输出）
+_WIN_ENV_MENU = """\
+  1) PowerShell（用户环境变量 + Profile）
+  2) 跳过（不写入环境变量）"""
+
+_POSIX_ENV_MENU = """\
+  1) bash（.bashrc / .bash_profile）
+  2) zsh（.zshrc）
+  3) fish（~/.config/fish/config.fish）
+  4) PowerShell（~/.config/powershell/Microsoft.PowerShell_profile.ps1）
+  5) POSIX 通用（~/.profile）
+  6) 跳过（不写入环境变量）"""
+
+# POSIX 菜单选项 1-5 对应的环境（顺序与 _POSIX_ENV_MENU 一致）
+_POSIX_ENVS = ('bash', 'zsh', 'fish', 'powershell', 'profile')
+_POSIX_CHOICE_MAP = {env: str(i + 1) for i, env in enumerate(_POSIX_ENVS)}
+_POSIX_ENV_BY_CHOICE = {choice: env for env, choice in _POSIX_CHOICE_MAP.items()}
+
+
 def choose_environment() -> str:
     """让用户选择当前的运行环境（用于写入环境变量并永久生效）"""
     default_env = detect_default_environment()
-    print()
-    print(f"{colors.CYAN}════════════════════════════════════════════════════════════{colors.NC}")
-    print(f"{colors.CYAN}                    运行环境选择                            {colors.NC}")
-    print(f"{colors.CYAN}════════════════════════════════════════════════════════════{colors.NC}")
-    print()
-    print(f"{colors.BLUE}检测到的平台: {sys.platform}{colors.NC}")
-    print(f"{colors.BLUE}检测到的 SHELL: {os.environ.get('SHELL', '(未设置)')}{colors.NC}")
+    print(_cyan_header("                    运行环境选择                            "))
+    cprint(f"检测到的平台: {sys.platform}", colors.BLUE)
+    cprint(f"检测到的 SHELL: {_SHELL or '(未设置)'}", colors.BLUE)
     print()
     print("请选择要写入环境变量的环境（永久生效）：")
-    if sys.platform == 'win32':
-        print("  1) PowerShell（用户环境变量 + Profile）")
-        print("  2) 跳过（不写入环境变量）")
+    if _IS_WIN:
+        print(_WIN_ENV_MENU)
         default_choice = '1' if default_env == 'powershell' else '2'
         choice = get_input(f"请输入选项 [默认 {default_choice}]: ").strip()
         if not choice:
             choice = default_choice
         return 'powershell' if choice == '1' else 'skip'
 
-    print("  1) bash（.bashrc / .bash_profile）")
-    print("  2) zsh（.zshrc）")
-    print("  3) fish（~/.config/fish/config.fish）")
-    print("  4) PowerShell（~/.config/powershell/Microsoft.PowerShell_profile.ps1）")
-    print("  5) POSIX 通用（~/.profile）")
-    print("  6) 跳过（不写入环境变量）")
-    default_map = {
-        'bash': '1',
-        'zsh': '2',
-        'fish': '3',
-        'powershell': '4',
-        'profile': '5',
-    }
-    default_choice = default_map.get(default_env, '5')
+    print(_POSIX_ENV_MENU)
+    default_choice = _POSIX_CHOICE_MAP.get(default_env, '5')
     choice = get_input(f"请输入选项 [默认 {default_choice}]: ").strip()
     if not choice:
         choice = default_choice
-    if choice == '1':
-        return 'bash'
-    if choice == '2':
-        return 'zsh'
-    if choice == '3':
-        return 'fish'
-    if choice == '4':
-        return 'powershell'
-    if choice == '5':
-        return 'profile'
-    return 'skip'
+    return _POSIX_ENV_BY_CHOICE.get(choice, 'skip')
 
 
 def get_shell_rc_file(selected_env: str) -> Optional[Path]:
     """根据用户选择返回需要写入的 rc/profile 文件路径"""
-    home = Path.home()
     if selected_env == 'bash':
-        bashrc = home / '.bashrc'
-        bash_profile = home / '.bash_profile'
-        if bashrc.exists() and bash_profile.exists():
+        bashrc = _BASHRC
+        bash_profile = _BASH_PROFILE
+        # 每个文件只 stat 一次
+        has_bashrc = bashrc.exists()
+        if has_bashrc and bash_profile.exists():
             print()
             print("检测到以下 bash 配置文件：")
             print(f"  1) {bashrc}")
@@ -343,25 +569,17 @@ def get_shell_rc_file(selected_env: str) -> Optional[Path]:
             if sub == '2':
                 return bash_profile
             return bashrc
-        if bashrc.exists():
+        if has_bashrc:
             return bashrc
         return bash_profile
-    if selected_env == 'zsh':
-        return home / '.zshrc'
-    if selected_env == 'fish':
-        fish_config = home / '.config' / 'fish' / 'config.fish'
-        fish_config.parent.mkdir(parents=True, exist_ok=True)
-        return fish_config
-    if selected_env == 'profile':
-        return home / '.profile'
-    return None
+    # fish 的配置目录由 write_managed_env_block 在写入时按需创建
+    return _SHELL_RC_FILES.get(selected_env)
 
 
 def get_powershell_profile_path() -> Path:
     """返回 PowerShell Profile 路径（按平台选默认位置）"""
-    home = Path.home()
-    if sys.platform == 'win32':
-        documents = Path(os.environ.get('USERPROFILE', str(home))) / 'Documents'
+    if _IS_WIN:
+        documents = Path(os.environ.get('USERPROFILE', str(_HOME))) / 'Documents'
         ps7_dir = documents / 'PowerShell'
         winps_dir = documents / 'WindowsPowerShell'
         # 优先使用 PowerShell 7 目录；如果仅存在 WindowsPowerShell 则使用它
@@ -370,66 +588,166 @@ def get_powershell_profile_path() -> Path:
         if winps_dir.exists():
             return winps_dir / 'Microsoft.PowerShell_profile.ps1'
         return ps7_dir / 'Microsoft.PowerShell_profile.ps1'
-    return home / '.config' / 'powershell' / 'Microsoft.PowerShell_profile.ps1'
+    return _HOME / '.config' / 'powershell' / 'Microsoft.PowerShell_profile.ps1'
+
+
+# 引用/转义用的翻译表：每个字符只处理一次
+_SH_SQ_TABLE = str.maketrans({"'": "'\"'\"'"})
+_PS_DQ_TABLE = str.maketrans({'`': '``', '"': '`"'})
+_PS_SQ_TABLE = str.maketrans({"'": "''"})
 
 
 def sh_single_quote(value: str) -> str:
     """在 bash/zsh/profile 中安全引用字符串（单引号）"""
-    return "'" + value.replace("'", "'\"'\"'") + "'"
+    return f"'{value.translate(_SH_SQ_TABLE)}'"
 
 
 def ps_double_quote(value: str) -> str:
     """在 PowerShell 双引号字符串中转义内容"""
-    return value.replace('`', '``').replace('"', '`"')
+    return value.translate(_PS_DQ_TABLE)
 
 
 def ps_single_quote(value: str) -> str:
     """在 PowerShell 单引号字符串中转义内容（单引号以两个单引号表示）"""
-    return "'" + value.replace("'", "''") + "'"
+    return f"'{value.translate(_PS_SQ_TABLE)}'"
 
 
 def write_managed_env_block(target: Path, lines: List[str]) -> bool:
     """写入/更新一个可重复执行的环境变量 block，避免重复追加"""
+    # 直接读取，文件不存在时按空内容处理（省去一次 exists() 探测）
     try:
-        existing = target.read_text(encoding='utf-8', errors='ignore') if target.exists() else ''
+        existing = target.read_text(encoding='utf-8', errors='ignore')
+        parent_exists = True
     except Exception:
         existing = ''
+        parent_exists = False
 
     block = "\n".join([MANAGED_ENV_BLOCK_START, *lines, MANAGED_ENV_BLOCK_END]) + "\n"
 
-    if MANAGED_ENV_BLOCK_START in existing and MANAGED_ENV_BLOCK_END in existing:
-        prefix, rest = existing.split(MANAGED_ENV_BLOCK_START, 1)
-        _, suffix = rest.split(MANAGED_ENV_BLOCK_END, 1)
-        new_content = prefix.rstrip() + "\n\n" + block + suffix.lstrip()
+    # 一次扫描定位已有 block，替换它（连同两侧空白）；找不到时追加到末尾
+    match = _MANAGED_ENV_BLOCK_RE.search(existing)
+    if match:
+        new_content = (existing[:match.start()].rstrip() + "\n\n" + block
+                       + existing[match.end():].lstrip())
     else:
         new_content = existing.rstrip() + "\n\n" + block
 
+    # 内容未变化时不重写文件，避免改动 mtime 触发编辑器/文件监视
+    if new_content == existing:
+        return True
+
     try:
-        target.parent.mkdir(parents=True, exist_ok=True)
+        # 读取成功说明目录已存在，不必再 mkdir
+        if not parent_exists:
+            target.parent.mkdir(parents=True, exist_ok=True)
         target.write_text(new_content, encoding='utf-8')
         return True
     except Exception:
         return False
 
 
+# 在 cmd 双引号内仍会被解释（或破坏引号配对）的字符，出现时不做批量 setx
+_CMD_UNSAFE_CHARS = ('"', '%', '\r', '\n')
+
+
+def _setx_command(name: str, value: str) -> str:
+    """构造一条可拼接进 cmd /c 的 setx 命令（值始终加双引号）"""
+    # 结尾的反斜杠会转义闭合引号，需要成对写出
+    trailing = len(value) - len(value.rstrip('\\'))
+    quoted = value + '\\' * trailing
+    return f'setx {name} "{quoted}"'
+
+
+def _setx_each(variables: Dict[str, str]) -> List[str]:
+    """逐个调用 setx，返回失败的变量名"""
+    import subprocess
+    failures: List[str] = []
+    for name, value in variables.items():
+        try:
+            result = subprocess.run(['setx', name, value], capture_output=True, text=True)
+            if result.returncode != 0:
+                failures.append(name)
+        except Exception:
+            failures.append(name)
+    return failures
+
+
+def setx_variables(variables: Dict[str, str]) -> List[str]:
+    """写入 Windows 用户环境变量，返回失败的变量名
+
+    优先在一个 cmd /c 进程中串联全部 setx，只创建一次进程；
+    批量执行失败（或值不适合放进 cmd 命令行）时再逐个 setx 以定位失败项。
+    """
+    import subprocess
+    if not any(c in value for value in variables.values() for c in _CMD_UNSAFE_CHARS):
+        command = ' && '.join(_setx_command(name, value) for name, value in variables.items())
+        try:
+            result = subprocess.run(f'cmd /d /c {command}', capture_output=True, text=True)
+            if result.returncode == 0:
+                return []
+        except Exception:
+            pass
+    return _setx_each(variables)
+
+
+def _broadcast_environment_change():
+    """通知已打开的程序用户环境变量已变化（等同 setx 的 WM_SETTINGCHANGE 广播）"""
+    try:
+        import ctypes
+        from ctypes import wintypes
+        HWND_BROADCAST = 0xFFFF
+        WM_SETTINGCHANGE = 0x001A
+        SMTO_ABORTIFHUNG = 0x0002
+        # 单独加载一份 user32，声明原型时不会影响 ctypes.windll 中共享的函数对象
+        send_message = ctypes.WinDLL('user32').SendMessageTimeoutW
+        # 最后一个参数是 PDWORD_PTR，Win64 上为 8 字节，不能用 c_ulong（Windows 上为 4 字节）
+        send_message.argtypes = [
+            wintypes.HWND, wintypes.UINT, wintypes.WPARAM, wintypes.LPCWSTR,
+            wintypes.UINT, wintypes.UINT, ctypes.POINTER(ctypes.c_size_t),
+        ]
+        send_message.restype = wintypes.LPARAM
+        result = ctypes.c_size_t()
+        send_message(
+            HWND_BROADCAST, WM_SETTINGCHANGE, 0, 'Environment',
+            SMTO_ABORTIFHUNG, 100, ctypes.byref(result)
+        )
+    except Exception:
+        # 广播失败不影响写入结果，新开的终端仍会读取到新值
+        pass
+
+
+def set_user_environment(variables: Dict[str, str]) -> List[str]:
+    """写入 Windows 用户环境变量（HKCU\\Environment），返回失败的变量名
+
+    直接写注册表，无需为 setx 创建子进程；注册表不可用时回退到 setx。
+    """
+    try:
+        import winreg
+        with winreg.OpenKey(winreg.HKEY_CURRENT_USER, 'Environment', 0, winreg.KEY_SET_VALUE) as key:
+            for name, value in variables.items():
+                # 与 setx 一致：包含 % 的值按可展开字符串保存
+                value_type = winreg.REG_EXPAND_SZ if '%' in value else winreg.REG_SZ
+                winreg.SetValueEx(key, name, 0, value_type, value)
+    except (ImportError, OSError):
+        return setx_variables(variables)
+    _broadcast_environment_change()
+    return []
+
+
 def configure_environment_variables(selected_env: str, config_dir: Path, base_url: str, api_key: str):
     """配置环境变量并永久生效（按用户选择的环境写入 rc/profile 或用户环境变量）"""
-    print()
-    print(f"{colors.CYAN}════════════════════════════════════════════════════════════{colors.NC}")
-    print(f"{colors.CYAN}                    环境变量配置                            {colors.NC}")
-    print(f"{colors.CYAN}════════════════════════════════════════════════════════════{colors.NC}")
-    print()
+    print(_cyan_header("                    环境变量配置                            "))
 
     if selected_env == 'skip':
-        print(f"{colors.YELLOW}[跳过] 未写入环境变量（按你的选择）{colors.NC}")
+        cprint("[跳过] 未写入环境变量（按你的选择）", colors.YELLOW)
         return
 
     # 不要在 rc/profile 中写死绝对路径：使用 shell 变量以便跨机器/用户目录迁移。
     # 仍然继续使用 config_dir 来写入 settings.json（那必须是绝对路径落盘）。
     if selected_env == 'powershell':
         claude_config_dir_value = "$HOME/.claude"
-    elif sys.platform == 'win32':
-        # 保险起见：Windows 通过 setx 写入时使用 USERPROFILE 占位符（不写死绝对路径）。
+    elif _IS_WIN:
+        # 保险起见：Windows 写入用户环境变量时使用 USERPROFILE 占位符（不写死绝对路径）。
         claude_config_dir_value = "%USERPROFILE%\\.claude"
     else:
         claude_config_dir_value = "$HOME/.claude"
@@ -442,16 +760,16 @@ def configure_environment_variables(selected_env: str, config_dir: Path, base_ur
         "CLAUDE_CODE_DISABLE_NONESSENTIAL_TRAFFIC": "1",
     }
 
-    print(f"{colors.YELLOW}[注意] 以下变量将被写入到你的 shell 配置文件/PowerShell Profile 中（包含明文 Token）{colors.NC}")
-    print(f"{colors.BLUE}将配置（永久生效）:{colors.NC}")
+    cprint("[注意] 以下变量将被写入到你的 shell 配置文件/PowerShell Profile 中（包含明文 Token）", colors.YELLOW)
+    cprint("将配置（永久生效）:", colors.BLUE)
     for name in variables.keys():
         display_value = variables[name]
         if name == "ANTHROPIC_AUTH_TOKEN":
             display_value = "***"
         print(f"  - {name}={display_value}")
 
-    if not confirm(f"{colors.GREEN}是否继续写入并使其永久生效？{colors.NC}", default=True):
-        print(f"{colors.YELLOW}[跳过] 未写入环境变量{colors.NC}")
+    if not confirm("是否继续写入并使其永久生效？", default=True, color=colors.GREEN):
+        cprint("[跳过] 未写入环境变量", colors.YELLOW)
         return
 
     # PowerShell（Windows 或用户主动选择）
@@ -468,29 +786,22 @@ def configure_environment_variables(selected_env: str, config_dir: Path, base_ur
         ok_profile = write_managed_env_block(profile, lines)
         if ok_profile:
             print(f"{colors.GREEN}✓ 已写入 PowerShell Profile: {colors.BLUE}{profile}{colors.NC}")
-            print(f"{colors.YELLOW}[重要] 新开 PowerShell 会自动生效；当前会话可执行：{colors.NC}")
+            cprint("[重要] 新开 PowerShell 会自动生效；当前会话可执行：", colors.YELLOW)
             print(f"  {colors.BLUE}. $PROFILE{colors.NC}")
         else:
-            print(f"{colors.RED}✗ 写入 PowerShell Profile 失败: {profile}{colors.NC}")
+            cprint(f"✗ 写入 PowerShell Profile 失败: {profile}", colors.RED)
 
-        if sys.platform == 'win32' and confirm(f"{colors.GREEN}是否同时写入 Windows 用户环境变量（setx，永久生效）？{colors.NC}", default=True):
-            failures: List[str] = []
-            for name, value in variables.items():
-                try:
-                    result = subprocess.run(['setx', name, value], capture_output=True, text=True)
-                    if result.returncode != 0:
-                        failures.append(name)
-                except Exception:
-                    failures.append(name)
+        if _IS_WIN and confirm("是否同时写入 Windows 用户环境变量（永久生效）？", default=True, color=colors.GREEN):
+            failures = set_user_environment(variables)
             if failures:
-                print(f"{colors.RED}✗ 以下变量 setx 失败: {', '.join(failures)}{colors.NC}")
+                cprint(f"✗ 以下变量写入失败: {', '.join(failures)}", colors.RED)
             else:
-                print(f"{colors.GREEN}✓ 用户环境变量已写入（可能需要重新打开终端生效）{colors.NC}")
+                cprint("✓ 用户环境变量已写入（可能需要重新打开终端生效）", colors.GREEN)
         return
 
     shell_rc = get_shell_rc_file(selected_env)
     if not shell_rc:
-        print(f"{colors.RED}[错误] 未找到可写入的配置文件（选择={selected_env}）{colors.NC}")
+        cprint(f"[错误] 未找到可写入的配置文件（选择={selected_env}）", colors.RED)
         return
 
     if selected_env == 'fish':
@@ -513,29 +824,33 @@ def configure_environment_variables(selected_env: str, config_dir: Path, base_ur
     ok = write_managed_env_block(shell_rc, lines)
     if ok:
         print(f"{colors.GREEN}✓ 环境变量已写入 {colors.BLUE}{shell_rc}{colors.NC}")
-        print(f"{colors.YELLOW}[重要] 请执行以下命令使其在当前终端生效，或重新打开终端：{colors.NC}")
+        cprint("[重要] 请执行以下命令使其在当前终端生效，或重新打开终端：", colors.YELLOW)
         print(f"  {colors.BLUE}source {shell_rc}{colors.NC}")
     else:
-        print(f"{colors.RED}✗ 写入失败: {shell_rc}{colors.NC}")
-        print(f"{colors.YELLOW}你可以手动添加以下内容：{colors.NC}")
+        cprint(f"✗ 写入失败: {shell_rc}", colors.RED)
+        cprint("你可以手动添加以下内容：", colors.YELLOW)
         for line in lines:
             print(f"  {line}")
 
 
+_COMPLETION_BOX = """\
+╔════════════════════════════════════════════════════════════╗
+║                    全部配置完成！                          ║
+╚════════════════════════════════════════════════════════════╝"""
+
+
 def print_completion():
     """打印完成信息"""
-    print()
-    print(f"{colors.GREEN}╔════════════════════════════════════════════════════════════╗{colors.NC}")
-    print(f"{colors.GREEN}║                    全部配置完成！                          ║{colors.NC}")
-    print(f"{colors.GREEN}╚════════════════════════════════════════════════════════════╝{colors.NC}")
-    print()
-    print(f"{colors.YELLOW}使用方法:{colors.NC}")
-    print("  1. 进入您的项目目录: cd 你的项目目录")
-    print("  2. 启动 Claude Code: claude")
-    print()
-    print(f"{colors.BLUE}查看已安装的 MCP: claude mcp list{colors.NC}")
-    print()
-    print(f"{colors.GREEN}祝您使用愉快！{colors.NC}")
+    # 整段完成信息一次写出
+    print(
+        f"\n{colors.GREEN}{_COMPLETION_BOX}{colors.NC}\n"
+        f"\n{colors.YELLOW}使用方法:{colors.NC}\n"
+        "  1. 进入您的项目目录: cd 你的项目目录\n"
+        "  2. 启动 Claude Code: claude\n"
+        f"\n{colors.BLUE}查看已安装的 MCP: claude mcp list{colors.NC}\n"
+        f"\n{colors.GREEN}祝您使用愉快！{colors.NC}\n",
+        end='', flush=True,
+    )
 
 
 def main():
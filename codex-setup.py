@@ -6,73 +6,88 @@ Codex CLI 一键配置脚本
 Python 3.8+
 """
 
+import functools
 import os
 import sys
 import re
 import json
-import shutil
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# 运行期间不会变化的平台信息，启动时读取一次
+_IS_WIN = sys.platform == 'win32'
 
 # 颜色支持
+@functools.lru_cache(maxsize=1)
+def _enable_win_vt() -> bool:
+    """为 Windows 10+ 控制台开启 ANSI 颜色支持（每个进程只调用一次）"""
+    if not _IS_WIN:
+        return False
+    try:
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        # 获取标准输出句柄
+        handle = kernel32.GetStdHandle(-11)
+        # 获取当前控制台模式
+        mode = ctypes.c_ulong()
+        kernel32.GetConsoleMode(handle, ctypes.byref(mode))
+        # 添加 ENABLE_VIRTUAL_TERMINAL_PROCESSING (0x0004) 标志
+        kernel32.SetConsoleMode(handle, mode.value | 0x0004)
+        return True
+    except Exception:
+        return False
+
+
 class Colors:
     """跨平台终端颜色支持"""
 
     def __init__(self):
         self.enabled = self._check_color_support()
+        # 预先计算颜色字符串，避免每次访问都执行属性方法
+        self.RED = '\033[0;31m' if self.enabled else ''
+        self.GREEN = '\033[0;32m' if self.enabled else ''
+        self.YELLOW = '\033[1;33m' if self.enabled else ''
+        self.BLUE = '\033[0;34m' if self.enabled else ''
+        self.CYAN = '\033[0;36m' if self.enabled else ''
+        self.NC = '\033[0m' if self.enabled else ''
 
     def _check_color_support(self) -> bool:
         """检查终端是否支持颜色"""
-        # Windows 10+ 支持 ANSI 颜色
-        if sys.platform == 'win32':
-            try:
-                import ctypes
-                kernel32 = ctypes.windll.kernel32
-                # 获取标准输出句柄
-                handle = kernel32.GetStdHandle(-11)
-                # 获取当前控制台模式
-                mode = ctypes.c_ulong()
-                kernel32.GetConsoleMode(handle, ctypes.byref(mode))
-                # 添加 ENABLE_VIRTUAL_TERMINAL_PROCESSING (0x0004) 标志
-                kernel32.SetConsoleMode(handle, mode.value | 0x0004)
-                return True
-            except Exception:
-                return os.environ.get('TERM') is not None
-        return sys.stdout.isatty()
-
-    @property
-    def RED(self) -> str:
-        return '\033[0;31m' if self.enabled else ''
-
-    @property
-    def GREEN(self) -> str:
-        return '\033[0;32m' if self.enabled else ''
-
-    @property
-    def YELLOW(self) -> str:
-        return '\033[1;33m' if self.enabled else ''
-
-    @property
-    def BLUE(self) -> str:
-        return '\033[0;34m' if self.enabled else ''
-
-    @property
-    def CYAN(self) -> str:
-        return '\033[0;36m' if self.enabled else ''
-
-    @property
-    def NC(self) -> str:
-        return '\033[0m' if self.enabled else ''
+        if _IS_WIN:
+            return _enable_win_vt() or os.environ.get('TERM') is not None
+        return sys.stdout is not None and sys.stdout.isatty()
 
 
 colors = Colors()
 
 
+def cprint(line: str, color: str = '') -> None:
+    """以指定颜色输出一行文本（合并为一次写入）"""
+    if color:
+        print(f"{color}{line}{colors.NC}\n", end='')
+    else:
+        print(f"{line}\n", end='')
+
+
+# 配置目录只构造一次
+_CODEX_DIR = Path.home() / '.codex'
+
+
+# ANSI 转义序列需要正则匹配变长的 CSI 序列（ESC [ 或 8 位 CSI）
+_ANSI_RE = re.compile(r'(?:\x1b\[|\x9b)[0-9;]*[a-zA-Z~]')
+# 控制字符直接用 str.translate 删除（C 层单次遍历）
+_DEL_TABLE = dict.fromkeys(list(range(0x20)) + [0x7f], None)
+
+
 def clean_input(text: str) -> str:
     """清理输入中的不可见字符（控制字符、转义序列等）"""
-    # 移除 ANSI 转义序列
-    text = re.sub(r'\x1b\[[0-9;]*[a-zA-Z~]', '', text)
-    # 移除控制字符
-    text = re.sub(r'[\x00-\x1f\x7f]', '', text)
+    # 常见输入既没有转义序列也没有控制字符，先做廉价检查再决定是否处理
+    if '\x1b' in text or '\x9b' in text:
+        # 移除 ANSI 转义序列
+        text = _ANSI_RE.sub('', text)
+    if not text.isprintable():
+        # 移除控制字符
+        text = text.translate(_DEL_TABLE)
     return text.strip()
 
 
@@ -94,7 +109,7 @@ def get_tty_input(prompt: str) -> str:
 
     # stdin 被管道占用，需要从终端设备读取
     tty_path = None
-    if sys.platform == 'win32':
+    if _IS_WIN:
         tty_path = 'CON'
     else:
         tty_path = '/dev/tty'
@@ -116,42 +131,81 @@ def get_input(prompt: str) -> str:
         return ''
 
 
-def confirm(prompt: str, default: bool = False) -> bool:
-    """确认提示"""
+def confirm(prompt: str, default: bool = False, color: str = '') -> bool:
+    """确认提示（color 只作用于提示文本，不包括 [y/N] 后缀）"""
     suffix = '[Y/n]' if default else '[y/N]'
+    if color:
+        prompt = f"{color}{prompt}{colors.NC}"
     response = get_input(f"{prompt} {suffix}: ").lower()
     if not response:
         return default
     return response in ('y', 'yes')
 
 
+@functools.lru_cache(maxsize=None)
 def check_command_exists(command: str) -> bool:
-    """检查命令是否存在"""
+    """检查命令是否存在（结果缓存）"""
+    import shutil
     return shutil.which(command) is not None
 
 
+# Windows 上低层 fd 默认是文本模式，会把 \n 转成 \r\n，需要显式指定二进制
+_PRIVATE_OPEN_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0)
+
+
+def write_private_file(path, data: bytes) -> None:
+    """写入仅当前用户可读写（0o600）的文件：一次 open、直接写字节，不经过文本层"""
+    fd = os.open(str(path), _PRIVATE_OPEN_FLAGS, 0o600)
+    try:
+        # O_CREAT 的权限只对新建文件生效，已存在的文件需要单独收紧
+        if hasattr(os, 'fchmod'):
+            os.fchmod(fd, 0o600)
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+_BANNER = """\
+╔════════════════════════════════════════════════════════════╗
+║             Codex CLI 一键配置脚本                         ║
+║        适用于 Windows / Linux / WSL / macOS                ║
+╚════════════════════════════════════════════════════════════╝
+"""
+
+_RULE = '═' * 60
+
+
+def _cyan_header(title: str) -> str:
+    """生成 CYAN 分节标题（上下分隔线，前后各空一行），供一次 print 输出"""
+    return f"\n{colors.CYAN}{_RULE}\n{title}\n{_RULE}{colors.NC}\n"
+
+
 def print_banner():
     """打印横幅"""
-    print(f"{colors.CYAN}")
-    print("╔════════════════════════════════════════════════════════════╗")
-    print("║             Codex CLI 一键配置脚本                         ║")
-    print("║        适用于 Windows / Linux / WSL / macOS                ║")
-    print("╚════════════════════════════════════════════════════════════╝")
-    print(f"{colors.NC}")
+    # 整个横幅一次写出
+    print(f"{colors.CYAN}\n{_BANNER}{colors.NC}\n", end='', flush=True)
 
 
 def check_codex_installed():
     """检查 Codex CLI 是否已安装"""
     if not check_command_exists('codex'):
-        print(f"{colors.YELLOW}[提示] 未检测到 Codex CLI，请先安装：{colors.NC}")
+        cprint("[提示] 未检测到 Codex CLI，请先安装：", colors.YELLOW)
         print("  npm install -g @openai/codex")
         print()
 
 
+# API 密钥校验的提示文本（只有出错时才会输出）
+_API_KEY_EMPTY_MSG = "[错误] API 密钥不能为空！"
+_API_KEY_FORMAT_MSG = "[警告] API 密钥格式可能不正确，通常以 'sk-' 开头"
+_CANCELLED_MSG = "已取消配置"
+
+
 def get_api_config() -> tuple:
     """获取 API 配置"""
     # Base URL
-    print(f"{colors.GREEN}请输入 API Base URL (直接回车使用默认值 https://api.openai.com/v1):{colors.NC}")
+    cprint("请输入 API Base URL (直接回车使用默认值 https://api.openai.com/v1):", colors.GREEN)
     base_url = get_input("")
     if not base_url:
         base_url = "https://api.openai.com/v1"
@@ -160,36 +214,199 @@ def get_api_config() -> tuple:
         base_url = base_url.rstrip('/')
         if not base_url.endswith('/v1'):
             base_url = f"{base_url}/v1"
-    print(f"{colors.BLUE}使用 Base URL: {base_url}{colors.NC}")
+    cprint(f"使用 Base URL: {base_url}", colors.BLUE)
 
     # API Key
     print()
-    print(f"{colors.GREEN}请输入您的 API 密钥 (sk-xxx):{colors.NC}")
+    cprint("请输入您的 API 密钥 (sk-xxx):", colors.GREEN)
     api_key = get_input("")
 
     if not api_key:
-        print(f"{colors.RED}[错误] API 密钥不能为空！{colors.NC}")
+        cprint(_API_KEY_EMPTY_MSG, colors.RED)
         sys.exit(1)
 
-    if not api_key.startswith('sk-'):
-        print(f"{colors.YELLOW}[警告] API 密钥格式可能不正确，通常以 'sk-' 开头{colors.NC}")
+    # 一次切片比较即可判断前缀，常见的正确输入不会触发任何提示输出
+    if api_key[:3] != 'sk-':
+        cprint(_API_KEY_FORMAT_MSG, colors.YELLOW)
         if not confirm("是否继续？", default=False):
-            print(f"{colors.RED}已取消配置{colors.NC}")
+            cprint(_CANCELLED_MSG, colors.RED)
             sys.exit(1)
 
     return base_url, api_key
 
 
+# TOML 基本字符串需要转义的字符（一次 translate 完成）
+_TOML_ESCAPE_TABLE = str.maketrans({'\\': '\\\\', '"': '\\"'})
+
+
 def escape_toml_string(s: str) -> str:
     """转义 TOML 字符串中的特殊字符"""
+    # URL、API Key 几乎不会包含反斜杠或双引号，此时原样返回
+    if '\\' not in s and '"' not in s:
+        return s
     # 转义反斜杠和双引号
-    return s.replace('\\', '\\\\').replace('"', '\\"')
+    return s.translate(_TOML_ESCAPE_TABLE)
+
+
+# 表头行 [a.b] / [[a.b]]；键名按段解析，支持引号段（如 [projects."/path"]）
+_TOML_HEADER_RE = re.compile(r'^\s*(\[\[?)(.+?)\]\]?\s*(?:#.*)?$')
+_TOML_KEY_PART_RE = re.compile(r'\s*(?:"((?:[^"\\]|\\.)*)"|\'([^\']*)\'|([A-Za-z0-9_\-]+))\s*(\.?)')
+# 统计括号层数（跨行的数组 / 内联表）前先去掉字符串和注释
+_TOML_STRING_OR_COMMENT_RE = re.compile(r'"(?:[^"\\]|\\.)*"|\'[^\']*\'|#.*')
+
+# 一行：(键路径，非键值对行为 None；行文本；是否属于某个值，即键值对行或其跨行部分)
+_TomlLine = Tuple[Optional[Tuple[str, ...]], str, bool]
+# 一张表：(表路径，表头之前的顶层内容为 ()；是否为 [[数组表]]；各行，表的第一行是表头)
+_TomlSection = Tuple[Tuple[str, ...], bool, List[_TomlLine]]
+
+
+def _parse_toml_key(text: str) -> Tuple[str, ...]:
+    """把 a."b.c".'d' 形式的键或表名解析为各段组成的元组"""
+    parts: List[str] = []
+    pos = 0
+    while True:
+        match = _TOML_KEY_PART_RE.match(text, pos)
+        if not match:
+            raise ValueError(f"无法识别的键名: {text.strip()}")
+        parts.append(next(g for g in match.groups()[:3] if g is not None))
+        pos = match.end()
+        if not match.group(4):
+            break
+    if pos != len(text):
+        raise ValueError(f"无法识别的键名: {text.strip()}")
+    return tuple(parts)
+
+
+def _split_toml(content: str) -> List[_TomlSection]:
+    """按表头把 TOML 拆成表的列表，每行保留原有的换行符"""
+    if '"""' in content or "'''" in content:
+        raise ValueError("包含多行字符串")
+    sections: List[_TomlSection] = [((), False, [])]
+    depth = 0
+    for line in content.splitlines(keepends=True):
+        stripped = line.strip()
+        if depth:
+            # 上一行的数组或内联表尚未结束
+            key, in_value = None, True
+        else:
+            match = _TOML_HEADER_RE.match(line)
+            if match:
+                path = _parse_toml_key(match.group(2))
+                sections.append((path, match.group(1) == '[[', [(None, line, False)]))
+                continue
+            if not stripped or stripped.startswith('#'):
+                key, in_value = None, False
+            else:
+                key_text, sep, _ = line.partition('=')
+                if not sep:
+                    raise ValueError(f"无法识别的行: {stripped}")
+                key, in_value = _parse_toml_key(key_text), True
+        code = _TOML_STRING_OR_COMMENT_RE.sub('', line)
+        depth += code.count('[') + code.count('{') - code.count(']') - code.count('}')
+        sections[-1][2].append((key, line, in_value))
+    if depth:
+        raise ValueError("数组或内联表未闭合")
+    return sections
+
+
+def _is_prefix(a: Tuple[str, ...], b: Tuple[str, ...]) -> bool:
+    """a 是否等于 b 或是 b 的上级路径"""
+    return b[:len(a)] == a
+
+
+def _check_toml_conflicts(sections: List[_TomlSection], updates: Dict[Tuple[str, ...], Dict[str, str]]):
+    """已有配置通过点号键、内联表或 [[数组表]] 定义了要写入的表/键时，无法逐键合并"""
+    tables = [path for path in updates if path]
+    owned = [path + (key,) for path, values in updates.items() for key in values]
+    for path, is_array, lines in sections:
+        if path and (any(_is_prefix(key, path) for key in owned)
+                     or is_array and any(_is_prefix(path, table) for table in tables)):
+            raise ValueError(f"[{'.'.join(path)}] 与要写入的配置冲突")
+        for key, _, _ in lines:
+            if key is None or len(key) == 1 and key[0] in updates.get(path, ()):
+                continue
+            full = path + key
+            for target in tables + owned:
+                if _is_prefix(full, target) or _is_prefix(target, full) and not _is_prefix(target, path):
+                    raise ValueError(f"{'.'.join(full)} 已通过点号键或内联表定义")
+
+
+def merge_toml(existing: str, fragment: str) -> str:
+    """把 TOML 片段逐键合并进已有配置
+
+    片段中的每个键替换已有配置同一张表中的同名键，没有则加在该表最后一个键之后；
+    已有配置中没有的表追加到末尾。其他键、子表、注释和空行原样保留，换行符沿用原文件。
+    已有配置无法可靠处理时（多行字符串、无法识别的行，或通过点号键、内联表、[[数组表]]
+    定义了要写入的表/键）抛出 ValueError，调用方应保留原文件不变。
+    """
+    sections = _split_toml(existing)
+    updates: Dict[Tuple[str, ...], Dict[str, str]] = {}
+    headers: Dict[Tuple[str, ...], str] = {}
+    for path, _, lines in _split_toml(fragment):
+        for key, line, _ in lines:
+            if key is not None:
+                updates.setdefault(path, {})[key[0]] = line.strip()
+                headers.setdefault(path, lines[0][1].strip())
+    _check_toml_conflicts(sections, updates)
+
+    newline = '\r\n' if '\r\n' in existing else '\n'
+    out: List[str] = []
+    for path, is_array, lines in sections:
+        pending = None if is_array else updates.pop(path, None)
+        body = [line for _, line, _ in lines]
+        if pending:
+            # 新键插入到最后一个值之后，使其后的注释和空行仍然留在下一个表头之前
+            end = 1 if path else 0
+            for i, (key, line, in_value) in enumerate(lines):
+                if key is not None and len(key) == 1 and key[0] in pending:
+                    if i + 1 < len(lines) and lines[i + 1][0] is None and lines[i + 1][2]:
+                        raise ValueError(f"{'.'.join(path + key)} 的值跨越多行")
+                    body[i] = pending.pop(key[0]) + (line[len(line.rstrip('\r\n')):] or newline)
+                if in_value:
+                    end = i + 1
+            if pending:
+                if end and not body[end - 1].endswith('\n'):
+                    body[end - 1] += newline
+                body[end:end] = [value + newline for value in pending.values()]
+        out.extend(body)
+
+    # 剩下的是已有配置中没有的表
+    for path, values in updates.items():
+        if out and not out[-1].endswith('\n'):
+            out[-1] += newline
+        if out and out[-1].strip():
+            out.append(newline)
+        out.append(headers[path] + newline)
+        out.extend(value + newline for value in values.values())
+    return ''.join(out)
+
+
+def update_config_toml(config_file: Path, fragment: str) -> bool:
+    """把片段合并写入 config.toml，返回是否成功；失败时保留原文件，并提示手动添加"""
+    try:
+        try:
+            # 按字节读取以保留原有的换行符；utf-8-sig 会去掉开头可能存在的 BOM
+            existing = config_file.read_bytes().decode('utf-8-sig')
+        except FileNotFoundError:
+            existing = ''
+        merged = merge_toml(existing, fragment)
+        # 内容未变化时跳过写入
+        if merged != existing:
+            write_private_file(config_file, merged.encode('utf-8'))
+        return True
+    except (OSError, UnicodeDecodeError, ValueError) as e:
+        cprint(f"[警告] 未能更新 {config_file}（{e}），文件保持不变", colors.YELLOW)
+        cprint("你可以手动添加以下内容：", colors.YELLOW)
+        print(fragment.strip('\n'))
+        return False
 
 
 def write_config_files(base_url: str, api_key: str) -> Path:
     """写入配置文件"""
-    config_dir = Path.home() / '.codex'
-    config_dir.mkdir(parents=True, exist_ok=True)
+    config_dir = _CODEX_DIR
+    # 目录通常已存在：一次 stat 即可，无需 mkdir 失败后再确认
+    if not config_dir.is_dir():
+        config_dir.mkdir(parents=True, exist_ok=True)
 
     # 写入 config.toml
     config_file = config_dir / 'config.toml'
@@ -207,15 +424,19 @@ base_url = "{escaped_base_url}"
 wire_api = "responses"
 requires_openai_auth = true
 '''
-    config_file.write_text(config_content, encoding='utf-8')
+    # 在已有配置上合并，保留用户的其他设置和已配置的 MCP
+    config_written = update_config_toml(config_file, config_content)
 
-    # 写入 auth.json
+    # 写入 auth.json（包含 API Key，仅允许当前用户读写）
     auth_file = config_dir / 'auth.json'
-    auth_content = json.dumps({"OPENAI_API_KEY": api_key}, indent=2)
-    auth_file.write_text(auth_content, encoding='utf-8')
+    auth_content = json.dumps({"OPENAI_API_KEY": api_key}, indent=2, ensure_ascii=False)
+    write_private_file(auth_file, auth_content.encode('utf-8'))
 
     print()
-    print(f"{colors.GREEN}✓ API 配置完成！{colors.NC}")
+    if config_written:
+        cprint("✓ API 配置完成！", colors.GREEN)
+    else:
+        cprint("✗ config.toml 未更新，请按上面的提示手动添加", colors.RED)
     print("配置文件位置:")
     print(f"  {colors.BLUE}{config_file}{colors.NC}")
     print(f"  {colors.BLUE}{auth_file}{colors.NC}")
@@ -225,82 +446,88 @@ requires_openai_auth = true
 
 def install_mcp_servers(config_dir: Path):
     """安装 MCP 服务器"""
-    print()
-    print(f"{colors.CYAN}════════════════════════════════════════════════════════════{colors.NC}")
-    print(f"{colors.CYAN}                    MCP 服务器安装                          {colors.NC}")
-    print(f"{colors.CYAN}════════════════════════════════════════════════════════════{colors.NC}")
-    print()
+    print(_cyan_header("                    MCP 服务器安装                          "))
 
     config_file = config_dir / 'config.toml'
-    mcp_config = ""
+    # 各服务器的配置块先收集起来，最后一次拼接
+    mcp_parts: List[str] = []
+    labels: List[str] = []
 
     # Context7 MCP
-    if confirm(f"{colors.GREEN}是否安装 Context7 MCP？(用于获取最新库文档){colors.NC}", default=False):
-        print(f"{colors.GREEN}请输入 Context7 API Key:{colors.NC}")
+    if confirm("是否安装 Context7 MCP？(用于获取最新库文档)", default=False, color=colors.GREEN):
+        cprint("请输入 Context7 API Key:", colors.GREEN)
         context7_key = get_input("")
         if context7_key:
             escaped_key = escape_toml_string(context7_key)
-            mcp_config += f'''
+            mcp_parts.append(f'''
 
 [mcp_servers.context7]
 type = "stdio"
 command = "npx"
 args = ["-y", "@upstash/context7-mcp", "--api-key", "{escaped_key}"]
-tool_timeout_sec = 60.0'''
-            print(f"{colors.GREEN}✓ Context7 MCP 配置已添加{colors.NC}")
+tool_timeout_sec = 60.0''')
+            labels.append('Context7')
         else:
-            print(f"{colors.YELLOW}[跳过] 未输入 API Key，跳过 Context7 安装{colors.NC}")
+            cprint("[跳过] 未输入 API Key，跳过 Context7 安装", colors.YELLOW)
 
     # Cunzhi MCP
     print()
-    if confirm(f"{colors.GREEN}是否安装 Cunzhi MCP？(智能代码审查工具){colors.NC}", default=False):
-        print(f"{colors.GREEN}请输入 Cunzhi 可执行文件的完整路径 (如 /path/to/cz 或 C:\\path\\to\\cz.exe):{colors.NC}")
+    if confirm("是否安装 Cunzhi MCP？(智能代码审查工具)", default=False, color=colors.GREEN):
+        cprint("请输入 Cunzhi 可执行文件的完整路径 (如 /path/to/cz 或 C:\\path\\to\\cz.exe):", colors.GREEN)
         cunzhi_path = get_input("")
         if cunzhi_path:
             cunzhi_path_obj = Path(cunzhi_path)
             if cunzhi_path_obj.exists():
                 # 在 TOML 中需要转义反斜杠和双引号
                 escaped_path = escape_toml_string(str(cunzhi_path_obj))
-                mcp_config += f'''
+                mcp_parts.append(f'''
 
 [mcp_servers.cunzhi]
 type = "stdio"
 command = "{escaped_path}"
-tool_timeout_sec = 600.0'''
-                print(f"{colors.GREEN}✓ Cunzhi MCP 配置已添加{colors.NC}")
+tool_timeout_sec = 600.0''')
+                labels.append('Cunzhi')
             else:
-                print(f"{colors.YELLOW}[跳过] 文件不存在: {cunzhi_path}{colors.NC}")
+                cprint(f"[跳过] 文件不存在: {cunzhi_path}", colors.YELLOW)
         else:
-            print(f"{colors.YELLOW}[跳过] 未输入路径，跳过 Cunzhi 安装{colors.NC}")
+            cprint("[跳过] 未输入路径，跳过 Cunzhi 安装", colors.YELLOW)
 
     # GitHub MCP
     print()
-    if confirm(f"{colors.GREEN}是否安装 GitHub MCP？(GitHub 文档查询){colors.NC}", default=True):
-        mcp_config += '''
+    if confirm("是否安装 GitHub MCP？(GitHub 文档查询)", default=True, color=colors.GREEN):
+        mcp_parts.append('''
 
 [mcp_servers.github]
 type = "http"
-url = "https://gitmcp.io/docs"'''
-        print(f"{colors.GREEN}✓ GitHub MCP 配置已添加{colors.NC}")
+url = "https://gitmcp.io/docs"''')
+        labels.append('GitHub')
+
+    # 合并 MCP 配置到 config.toml（重复运行时更新同名服务器，而不是重复追加）
+    if mcp_parts:
+        if update_config_toml(config_file, ''.join(mcp_parts)):
+            for label in labels:
+                cprint(f"✓ {label} MCP 配置已添加", colors.GREEN)
+        else:
+            cprint("✗ MCP 配置未写入 config.toml", colors.RED)
 
-    # 追加 MCP 配置到 config.toml
-    if mcp_config:
-        with open(config_file, 'a', encoding='utf-8') as f:
-            f.write(mcp_config)
+
+_COMPLETION_BOX = """\
+╔════════════════════════════════════════════════════════════╗
+║                    全部配置完成！                          ║
+╚════════════════════════════════════════════════════════════╝"""
 
 
 def print_completion():
     """打印完成信息"""
-    print()
-    print(f"{colors.GREEN}╔════════════════════════════════════════════════════════════╗{colors.NC}")
-    print(f"{colors.GREEN}║                    全部配置完成！                          ║{colors.NC}")
-    print(f"{colors.GREEN}╚════════════════════════════════════════════════════════════╝{colors.NC}")
-    print()
-    print(f"{colors.YELLOW}使用方法:{colors.NC}")
-    print("  1. 进入您的项目目录: cd 你的项目目录")
-    print("  2. 启动 Codex CLI: codex")
-    print()
-    print(f"{colors.GREEN}祝您使用愉快！{colors.NC}")
+    # 整段完成信息一次写出
+    print(
+        f"\n{colors.GREEN}{_COMPLETION_BOX}{colors.NC}\n"
+        f"\n{colors.YELLOW}使用方法:{colors.NC}\n"
+        "  1. 进入您的项目目录: cd 你的项目目录\n"
+        "  2. 启动 Codex CLI: codex\n"
+        f"\n{colors.GREEN}祝您使用愉快！{colors.NC}\n",
+        end='', flush=True,
+    )
 
 
 def main():
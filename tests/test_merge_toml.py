@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""codex-setup.py 中 merge_toml 的测试"""
+
+import importlib.util
+import unittest
+from pathlib import Path
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    tomllib = None
+
+_SCRIPT = Path(__file__).resolve().parent.parent / 'codex-setup.py'
+_spec = importlib.util.spec_from_file_location('codex_setup', _SCRIPT)
+codex_setup = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(codex_setup)
+merge_toml = codex_setup.merge_toml
+
+PROVIDER = '''model_provider = "custom"
+model = "gpt-5.2-codex"
+
+[model_providers.custom]
+name = "custom"
+base_url = "https://new.example/v1"
+'''
+
+GITHUB = '''
+
+[mcp_servers.github]
+type = "http"
+url = "https://gitmcp.io/docs"'''
+
+
+class MergeTomlTest(unittest.TestCase):
+
+    def merge(self, existing: str, fragment: str) -> str:
+        merged = merge_toml(existing, fragment)
+        if tomllib is not None:
+            tomllib.loads(merged)
+        # 重复运行结果不变
+        self.assertEqual(merge_toml(merged, fragment), merged)
+        return merged
+
+    def load(self, content: str) -> dict:
+        if tomllib is None:
+            self.skipTest('需要 tomllib')
+        return tomllib.loads(content)
+
+    def test_empty_config(self):
+        self.assertEqual(self.merge('', PROVIDER), PROVIDER)
+        self.assertEqual(self.merge('', GITHUB), GITHUB.strip('\n') + '\n')
+
+    def test_keeps_user_keys_subtables_and_comments(self):
+        existing = '''# codex 配置
+model = "old"
+approval_policy = "never"
+
+# provider 配置
+[model_providers.custom]
+name = "custom"
+env_key = "MY_KEY"
+base_url = "https://old.example/v1"
+
+[model_providers.custom.http_headers]
+X-Org = "me"
+
+[model_providers.custom.query_params]
+api-version = "1"
+
+# profiles below
+[profiles.fast]
+model = "small"
+'''
+        merged = self.merge(existing, PROVIDER)
+        self.assertEqual(merged, '''# codex 配置
+model = "gpt-5.2-codex"
+approval_policy = "never"
+model_provider = "custom"
+
+# provider 配置
+[model_providers.custom]
+name = "custom"
+env_key = "MY_KEY"
+base_url = "https://new.example/v1"
+
+[model_providers.custom.http_headers]
+X-Org = "me"
+
+[model_providers.custom.query_params]
+api-version = "1"
+
+# profiles below
+[profiles.fast]
+model = "small"
+''')
+
+    def test_new_keys_go_after_last_value_not_before_comment(self):
+        existing = '''[model_providers.custom]
+name = "custom"
+args = [
+  "a",
+]
+# 下一个表
+[projects."/home/me/repo"]
+trust_level = "trusted"
+'''
+        merged = self.merge(existing, PROVIDER)
+        self.assertIn('args = [\n  "a",\n]\nbase_url = "https://new.example/v1"\n# 下一个表\n', merged)
+        self.assertTrue(merged.startswith('model_provider = "custom"\nmodel = "gpt-5.2-codex"\n['))
+
+    def test_keeps_quoted_tables(self):
+        existing = '''[model_providers.custom]
+name = "custom"
+
+[projects."/home/me/repo"]
+trust_level = "trusted"
+
+[projects.'C:\\work\\app']
+trust_level = "trusted"
+'''
+        data = self.load(self.merge(existing, PROVIDER))
+        self.assertEqual(data['projects'], {
+            '/home/me/repo': {'trust_level': 'trusted'},
+            'C:\\work\\app': {'trust_level': 'trusted'},
+        })
+        self.assertEqual(data['model_providers']['custom']['base_url'], 'https://new.example/v1')
+
+    def test_quoted_table_name_is_updated_in_place(self):
+        existing = '''[mcp_servers."github"]
+type = "http"
+url = "https://old.example"
+startup_timeout_sec = 20
+'''
+        merged = self.merge(existing, GITHUB)
+        self.assertEqual(merged, '''[mcp_servers."github"]
+type = "http"
+url = "https://gitmcp.io/docs"
+startup_timeout_sec = 20
+''')
+
+    def test_nested_array_lines_are_not_headers(self):
+        existing = 'matrix = [\n  [1, 2]\n]\n'
+        data = self.load(self.merge(existing, PROVIDER + GITHUB))
+        self.assertEqual(data['matrix'], [[1, 2]])
+
+    def test_keeps_crlf_line_endings(self):
+        existing = 'model = "old"\r\n\r\n[model_providers.custom]\r\nname = "custom"\r\n'
+        merged = self.merge(existing, PROVIDER + GITHUB)
+        self.assertNotIn('\n', merged.replace('\r\n', ''))
+
+    def test_unrelated_dotted_keys_and_inline_tables_are_kept(self):
+        existing = '''tui.notifications = true
+shell_environment_policy = { inherit = "core" }
+
+[model_providers]
+other = { name = "other" }
+'''
+        data = self.load(self.merge(existing, PROVIDER))
+        self.assertIs(data['tui']['notifications'], True)
+        self.assertEqual(data['model_providers']['other'], {'name': 'other'})
+        self.assertEqual(data['model_providers']['custom']['name'], 'custom')
+
+    def test_refuses_dotted_keys_for_target_table(self):
+        for existing in (
+            'model_providers.custom.name = "custom"\n',
+            '[model_providers]\ncustom.name = "custom"\n',
+            'model.name = "x"\n',
+        ):
+            with self.subTest(existing=existing), self.assertRaises(ValueError):
+                merge_toml(existing, PROVIDER)
+
+    def test_refuses_inline_tables_for_target_table(self):
+        for existing in (
+            'model_providers = { custom = { name = "custom" } }\n',
+            '[model_providers]\ncustom = { name = "custom" }\n',
+            '[mcp_servers]\ngithub = {\n  url = "https://old.example",\n}\n',
+        ):
+            with self.subTest(existing=existing), self.assertRaises(ValueError):
+                merge_toml(existing, PROVIDER + GITHUB)
+
+    def test_refuses_array_of_tables_for_target_table(self):
+        with self.assertRaises(ValueError):
+            merge_toml('[[mcp_servers.github]]\nurl = "x"\n', GITHUB)
+
+    def test_refuses_what_it_cannot_parse(self):
+        for existing in (
+            'instructions = """\n[model_providers.custom]\n"""\n',
+            'matrix = [\n  1,\n',
+            'just some text\n',
+        ):
+            with self.subTest(existing=existing), self.assertRaises(ValueError):
+                merge_toml(existing, PROVIDER)
+
+
+class UpdateConfigTomlTest(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.config_file = Path(self.tmp.name) / 'config.toml'
+
+    def update(self) -> bool:
+        import contextlib
+        import io
+        with contextlib.redirect_stdout(io.StringIO()):
+            return codex_setup.update_config_toml(self.config_file, PROVIDER)
+
+    def test_strips_bom(self):
+        self.config_file.write_bytes(b'\xef\xbb\xbfapproval_policy = "never"\n')
+        self.assertTrue(self.update())
+        self.assertTrue(self.config_file.read_bytes().startswith(b'approval_policy = "never"\n'))
+
+    def test_keeps_file_it_cannot_decode(self):
+        original = b'name = "\xff"\n'
+        self.config_file.write_bytes(original)
+        self.assertFalse(self.update())
+        self.assertEqual(self.config_file.read_bytes(), original)
+
+    def test_keeps_file_it_cannot_merge(self):
+        original = b'model_providers.custom.name = "x"\n'
+        self.config_file.write_bytes(original)
+        self.assertFalse(self.update())
+        self.assertEqual(self.config_file.read_bytes(), original)
+
+
+if __name__ == '__main__':
+    unittest.main()